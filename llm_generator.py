@@ -1,9 +1,114 @@
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Dict, List, Optional
-import json
+import orjson
 import base64
+import io
 import time
+import re
+
+# Characters b64decode discards; stripped before computing the preview padding
+_B64_NON_ALPHABET_RE = re.compile(r"[^A-Za-z0-9+/]")
+
+# Matches a "FILE: <name>" header line, allowing markdown around it such as "### " or "**";
+# each file body runs until the next header
+_FILE_RE = re.compile(r"^[^\n]*?FILE:[ \t*`]*([^\s*`]+)[^\n]*\n?", re.MULTILINE)
+
+# Shared with app.py, which writes it as the LICENSE of round 1 repositories
+MIT_LICENSE = """MIT License
+
+Copyright (c) 2025
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE."""
+
+# Static pieces of the generate_app prompt; _build_prompt joins them with the task-specific parts
+_PROMPT_HEAD = """You are building a single-page web application for GitHub Pages deployment.
+
+**Task ID**: """
+
+_PROMPT_INSTRUCTIONS = """
+
+**Instructions**:
+1. Generate a COMPLETE, FUNCTIONAL single-page application (HTML/CSS/JS)
+2. Use CDN links for any libraries (Bootstrap, marked, highlight.js, Papaparse for CSV, etc.)
+3. The app must be self-contained in index.html (embed all CSS/JS or use minimal additional files)
+4. Handle attachments by embedding data URIs directly in the code or parsing them
+5. Implement ALL functionality described in the brief
+6. Add proper error handling and user feedback
+7. Make it visually appealing with Bootstrap 5 or modern CSS
+8. Ensure all checks can pass when tested
+9. Use semantic HTML and accessible design
+
+**CRITICAL REQUIREMENTS**: 
+- NEVER use localStorage or sessionStorage (not supported in evaluation environment)
+- Use in-memory JavaScript variables/objects for any state management
+- All data must be stored in JavaScript variables only
+- If attachments contain CSV data, parse it using Papaparse CDN
+- If attachments contain JSON, parse it directly in JavaScript
+- Make sure all IDs mentioned in checks exist in your HTML
+
+**Output Format**:
+Provide the files in this EXACT format with clear markers:
+
+FILE: index.html
+```html
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <!-- Your complete HTML here -->
+</head>
+<body>
+    <!-- Your content here -->
+</body>
+</html>
+```
+
+FILE: README.md
+```markdown
+# """
+
+_PROMPT_TAIL = """
+
+## Summary
+[Brief description]
+
+## Setup & Usage
+[How to use the application]
+
+## Features
+[List of features]
+
+## Code Explanation
+[Explain the key parts of the code]
+
+## License
+MIT License
+```
+
+FILE: LICENSE
+```
+""" + MIT_LICENSE + """
+```
+
+Generate the complete application now. Make sure it's production-ready and will pass all checks."""
 
 class LLMCodeGenerator:
     """Generates application code using AIPipe API based on task briefs."""
@@ -13,14 +118,26 @@ class LLMCodeGenerator:
         if not self.api_key:
             raise EnvironmentError("AIPIPE_API_KEY not set")
         self.base_url = "https://api.aipipe.org/v1/chat/completions"
+        
+        # Persistent session so repeated LLM calls reuse one keep-alive connection
+        self._session = requests.Session()
+        self._session.headers.update({
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "Accept-Encoding": "gzip"
+        })
+        self._session.mount("https://", HTTPAdapter(
+            pool_maxsize=4,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=2,
+                status_forcelist=[429, 502, 503, 504],
+                allowed_methods=frozenset({"POST"})
+            )
+        ))
     
     def _call_aipipe(self, prompt: str, max_tokens: int = 8000) -> str:
         """Make API call to AIPipe."""
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
         payload = {
             "model": "claude-3-5-sonnet-20241022",  # or claude-3-opus-20240229
             "messages": [
@@ -34,14 +151,13 @@ class LLMCodeGenerator:
         }
         
         try:
-            response = requests.post(
+            response = self._session.post(
                 self.base_url,
-                headers=headers,
-                json=payload,
+                data=orjson.dumps(payload),
                 timeout=120
             )
             response.raise_for_status()
-            result = response.json()
+            result = orjson.loads(response.content)
             
             # AIPipe follows OpenAI format
             return result["choices"][0]["message"]["content"]
@@ -87,7 +203,8 @@ class LLMCodeGenerator:
         if not attachments:
             return "No attachments provided."
         
-        info = ["Attachments provided:"]
+        buf = io.StringIO()
+        buf.write("Attachments provided:")
         for att in attachments:
             name = att.get("name", "unknown")
             url = att.get("url", "")
@@ -99,22 +216,26 @@ class LLMCodeGenerator:
                     header, encoded = url.split(",", 1)
                     content_type = header.split(":")[1].split(";")[0]
                     
-                    # Decode base64
-                    decoded = base64.b64decode(encoded).decode('utf-8', errors='ignore')
+                    # Decode only enough base64 for the preview (1400 chars -> 1050 bytes).
+                    # Line breaks and other non-alphabet characters are dropped first so the
+                    # padding matches what b64decode actually sees (e.g. MIME-wrapped base64).
+                    window = encoded[:1600]
+                    alphabet = _B64_NON_ALPHABET_RE.sub("", window)
+                    prefix = alphabet[:1400]
+                    decoded = base64.b64decode(prefix + "=" * (-len(prefix) % 4))
                     
                     # Limit preview length
-                    preview = decoded[:1000] if len(decoded) > 1000 else decoded
-                    if len(decoded) > 1000:
+                    preview = decoded[:1000].decode('utf-8', errors='ignore')
+                    if len(encoded) > len(window) or len(alphabet) > 1400 or len(decoded) > 1000:
                         preview += "\n... (truncated)"
                     
-                    info.append(f"\n**{name}** ({content_type}):")
-                    info.append(f"```\n{preview}\n```")
+                    buf.write(f"\n\n**{name}** ({content_type}):\n```\n{preview}\n```")
                 except Exception as e:
-                    info.append(f"\n**{name}**: [Could not decode: {e}]")
+                    buf.write(f"\n\n**{name}**: [Could not decode: {e}]")
             else:
-                info.append(f"\n**{name}**: {url}")
+                buf.write(f"\n\n**{name}**: {url}")
         
-        return "\n".join(info)
+        return buf.getvalue()
     
     def _build_prompt(
         self,
@@ -126,132 +247,41 @@ class LLMCodeGenerator:
     ) -> str:
         """Build the prompt for the LLM."""
         
-        checks_formatted = "\n".join([f"- {check}" for check in checks])
+        checks_formatted = "\n".join(f"- {check}" for check in checks)
+        task_id = str(task_id)
         
-        prompt = f"""You are building a single-page web application for GitHub Pages deployment.
-
-**Task ID**: {task_id}
-**Round**: {round_number}
-
-**Brief**:
-{brief}
-
-**Requirements/Checks** (your app MUST pass these):
-{checks_formatted}
-
-**Attachments**:
-{attachment_info}
-
-**Instructions**:
-1. Generate a COMPLETE, FUNCTIONAL single-page application (HTML/CSS/JS)
-2. Use CDN links for any libraries (Bootstrap, marked, highlight.js, Papaparse for CSV, etc.)
-3. The app must be self-contained in index.html (embed all CSS/JS or use minimal additional files)
-4. Handle attachments by embedding data URIs directly in the code or parsing them
-5. Implement ALL functionality described in the brief
-6. Add proper error handling and user feedback
-7. Make it visually appealing with Bootstrap 5 or modern CSS
-8. Ensure all checks can pass when tested
-9. Use semantic HTML and accessible design
-
-**CRITICAL REQUIREMENTS**: 
-- NEVER use localStorage or sessionStorage (not supported in evaluation environment)
-- Use in-memory JavaScript variables/objects for any state management
-- All data must be stored in JavaScript variables only
-- If attachments contain CSV data, parse it using Papaparse CDN
-- If attachments contain JSON, parse it directly in JavaScript
-- Make sure all IDs mentioned in checks exist in your HTML
-
-**Output Format**:
-Provide the files in this EXACT format with clear markers:
-
-FILE: index.html
-```html
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <!-- Your complete HTML here -->
-</head>
-<body>
-    <!-- Your content here -->
-</body>
-</html>
-```
-
-FILE: README.md
-```markdown
-# {task_id}
-
-## Summary
-[Brief description]
-
-## Setup & Usage
-[How to use the application]
-
-## Features
-[List of features]
-
-## Code Explanation
-[Explain the key parts of the code]
-
-## License
-MIT License
-```
-
-FILE: LICENSE
-```
-MIT License
-
-Copyright (c) 2025
-
-Permission is hereby granted, free of charge, to any person obtaining a copy
-of this software and associated documentation files (the "Software"), to deal
-in the Software without restriction, including without limitation the rights
-to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
-copies of the Software, and to permit persons to whom the Software is
-furnished to do so, subject to the following conditions:
-
-The above copyright notice and this permission notice shall be included in all
-copies or substantial portions of the Software.
-
-THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
-IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
-FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
-AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
-LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
-OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
-SOFTWARE.
-```
-
-Generate the complete application now. Make sure it's production-ready and will pass all checks."""
-        
-        return prompt
+        return "".join([
+            _PROMPT_HEAD, task_id,
+            "\n**Round**: ", str(round_number),
+            "\n\n**Brief**:\n", str(brief),
+            "\n\n**Requirements/Checks** (your app MUST pass these):\n", checks_formatted,
+            "\n\n**Attachments**:\n", str(attachment_info),
+            _PROMPT_INSTRUCTIONS, task_id,
+            _PROMPT_TAIL
+        ])
     
     def _parse_response(self, response_text: str, task_id: str, brief: str) -> Dict[str, str]:
         """Parse LLM response to extract files."""
         files = {}
         
-        # Split by FILE: markers
-        parts = response_text.split("FILE: ")
-        
-        for part in parts[1:]:  # Skip first empty part
-            lines = part.strip().split("\n", 1)
-            if len(lines) < 2:
-                continue
-            
-            filename = lines[0].strip()
-            content = lines[1].strip()
+        # Find FILE: headers; each body ends at the next header or the end of the text
+        headers = list(_FILE_RE.finditer(response_text))
+        for i, header in enumerate(headers):
+            end = headers[i + 1].start() if i + 1 < len(headers) else len(response_text)
+            content = response_text[header.end():end].strip()
             
-            # Remove code block markers
+            # Remove code block markers, keeping any fences nested inside the file
             if content.startswith("```"):
-                # Find language identifier and remove it
                 first_newline = content.find("\n")
-                if first_newline != -1:
-                    content = content[first_newline + 1:]
-                # Remove closing ```
-                if content.endswith("```"):
-                    content = content[:-3].strip()
+                content = content[first_newline + 1:] if first_newline != -1 else ""
+                closing = content.rfind("```")
+                if closing != -1:
+                    content = content[:closing]
+                content = content.strip()
             
-            files[filename] = content
+            if not content:
+                continue
+            files[header.group(1)] = content
         
         # Fallback: try to extract HTML if FILE markers weren't used
         if "index.html" not in files:
@@ -274,27 +304,7 @@ Generate the complete application now. Make sure it's production-ready and will
     
     def _get_mit_license(self) -> str:
         """Return standard MIT license text."""
-        return """MIT License
-
-Copyright (c) 2025
-
-Permission is hereby granted, free of charge, to any person obtaining a copy
-of this software and associated documentation files (the "Software"), to deal
-in the Software without restriction, including without limitation the rights
-to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
-copies of the Software, and to permit persons to whom the Software is
-furnished to do so, subject to the following conditions:
-
-The above copyright notice and this permission notice shall be included in all
-copies or substantial portions of the Software.
-
-THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
-IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
-FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
-AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
-LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
-OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
-SOFTWARE."""
+        return MIT_LICENSE
     
     def _get_default_readme(self, task_id: str, brief: str) -> str:
         """Return default README template."""